@@ -1,9 +1,117 @@
 import json
 import os
-from typing import Dict, Any, List
+import base64
+import gzip
+import hashlib
+import zlib
+from abc import ABC, abstractmethod
+from datetime import date, datetime
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
 import psycopg2
 from psycopg2.extras import RealDictCursor
 
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_BYTES = int(os.environ.get('RESPONSE_COMPRESS_MIN_BYTES', '1024'))
+
+class LibraryCache(ABC):
+    '''
+    Cache tier for serialized libraries: key is the user id, value is (etag, UTF-8 JSON body).
+    Subclass it to plug a shared tier (or a local stand-in) in via set_shared_cache.
+    '''
+    @abstractmethod
+    def get(self, key: str) -> Optional[Tuple[str, bytes]]:
+        ...
+    
+    @abstractmethod
+    def set(self, key: str, etag: str, body: bytes) -> None:
+        ...
+    
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        ...
+
+class MemoryLibraryCache(LibraryCache):
+    '''In-process LRU tier bounded by total body bytes, lives as long as the warm function instance'''
+    def __init__(self, max_bytes: int, max_entry_bytes: int):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.size = 0
+        self.entries: 'OrderedDict[str, Tuple[str, bytes]]' = OrderedDict()
+    
+    def get(self, key: str) -> Optional[Tuple[str, bytes]]:
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+        return entry
+    
+    def set(self, key: str, etag: str, body: bytes) -> None:
+        self.delete(key)
+        if len(body) > self.max_entry_bytes:
+            return
+        self.entries[key] = (etag, body)
+        self.size += len(body)
+        while self.size > self.max_bytes:
+            _, (_, evicted) = self.entries.popitem(last=False)
+            self.size -= len(evicted)
+    
+    def delete(self, key: str) -> None:
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[1])
+
+class RedisLibraryCache(LibraryCache):
+    '''Shared tier across function instances, enabled with LIBRARY_CACHE_URL=redis://...'''
+    def __init__(self, url: str, ttl: int = 3600):
+        self.client = redis.Redis.from_url(url, socket_timeout=0.5)
+        self.ttl = ttl
+    
+    def get(self, key: str) -> Optional[Tuple[str, bytes]]:
+        raw = self.client.get(f'library:{key}')
+        if raw is None:
+            return None
+        etag, _, body = raw.partition(b'\n')
+        return etag.decode('utf-8'), body
+    
+    def set(self, key: str, etag: str, body: bytes) -> None:
+        self.client.set(f'library:{key}', etag.encode('utf-8') + b'\n' + body, ex=self.ttl)
+    
+    def delete(self, key: str) -> None:
+        self.client.delete(f'library:{key}')
+
+memory_cache: LibraryCache = MemoryLibraryCache(
+    int(os.environ.get('LIBRARY_CACHE_MAX_BYTES', str(32 * 1024 * 1024))),
+    int(os.environ.get('LIBRARY_CACHE_MAX_ENTRY_BYTES', str(4 * 1024 * 1024)))
+)
+shared_cache: Optional[LibraryCache] = None
+
+if os.environ.get('LIBRARY_CACHE_URL') and redis is not None:
+    shared_cache = RedisLibraryCache(os.environ['LIBRARY_CACHE_URL'])
+
+def set_shared_cache(cache: Optional[LibraryCache]) -> None:
+    '''Plug in a shared cache tier (or a local stand-in), None disables it'''
+    global shared_cache
+    shared_cache = cache
+
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Business: Manage user books - save, list, get, update books with characters and chapters
@@ -18,7 +126,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, PUT, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token, If-None-Match',
                 'Access-Control-Max-Age': '86400'
             },
             'body': ''
@@ -67,9 +175,35 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         cur = conn.cursor(cursor_factory=RealDictCursor)
         
         if method == 'GET':
+            etag = library_etag(cur, user_id)
+            cache_headers = {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Expose-Headers': 'ETag',
+                'Cache-Control': 'private, no-cache',
+                'ETag': etag
+            }
+            
+            if_none_match = headers.get('if-none-match') or headers.get('If-None-Match')
+            if etag_matches(if_none_match, etag):
+                cur.close()
+                conn.close()
+                return {
+                    'statusCode': 304,
+                    'headers': cache_headers,
+                    'isBase64Encoded': False,
+                    'body': ''
+                }
+            
+            cached_body = read_cached_library(user_id, etag)
+            if cached_body is not None:
+                cur.close()
+                conn.close()
+                return encoded_response(200, cached_body, cache_headers, headers)
+            
             cur.execute("""
                 SELECT id, title, genre, description, idea, turning_point, 
-                       unique_features, pages, writing_style, text_tone, created_at
+                       unique_features, pages, writing_style, text_tone, generation_job_id, created_at
                 FROM books WHERE user_id = %s
                 ORDER BY created_at DESC
             """, (user_id,))
@@ -82,8 +216,15 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 cur.execute("SELECT * FROM characters WHERE book_id = %s", (book['id'],))
                 book_dict['characters'] = [dict(c) for c in cur.fetchall()]
                 
-                cur.execute("SELECT * FROM chapters WHERE book_id = %s ORDER BY chapter_order", (book['id'],))
-                book_dict['chapters'] = [dict(c) for c in cur.fetchall()]
+                cur.execute("""
+                    SELECT c.id, c.book_id, c.title, c.chapter_order, c.created_at,
+                           t.codec, t.body
+                    FROM chapters c
+                    LEFT JOIN chapter_texts t ON t.text_hash = c.text_hash
+                    WHERE c.book_id = %s
+                    ORDER BY c.chapter_order
+                """, (book['id'],))
+                book_dict['chapters'] = [chapter_from_row(c) for c in cur.fetchall()]
                 
                 cur.execute("SELECT * FROM illustrations WHERE book_id = %s ORDER BY illustration_order", (book['id'],))
                 book_dict['illustrations'] = [dict(i) for i in cur.fetchall()]
@@ -93,15 +234,10 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             cur.close()
             conn.close()
             
-            return {
-                'statusCode': 200,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'isBase64Encoded': False,
-                'body': json.dumps({'books': books_with_data}, default=str)
-            }
+            body = dumps({'books': books_with_data})
+            write_cached_library(user_id, etag, body)
+            
+            return encoded_response(200, body, cache_headers, headers)
         
         elif method == 'POST':
             body_data = json.loads(event.get('body', '{}'))
@@ -126,8 +262,9 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             
             cur.execute("""
                 INSERT INTO books (user_id, title, genre, description, idea, turning_point,
-                                 unique_features, pages, writing_style, text_tone)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                                 unique_features, pages, writing_style, text_tone, generation_job_id)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
+                        (SELECT id FROM generation_jobs WHERE id = %s))
                 RETURNING id
             """, (
                 user_id,
@@ -139,7 +276,8 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 body_data.get('uniqueFeatures', ''),
                 body_data.get('pages', ''),
                 style_str,
-                tone_str
+                tone_str,
+                body_data.get('jobId')
             ))
             book_id = cur.fetchone()['id']
             
@@ -159,11 +297,13 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     char.get('role', 'main')
                 ))
             
-            for idx, chapter in enumerate(body_data.get('chapters', [])):
+            chapters = body_data.get('chapters', [])
+            text_hashes = store_chapter_texts(cur, [chapter.get('text', '') for chapter in chapters])
+            for idx, (chapter, text_hash) in enumerate(zip(chapters, text_hashes)):
                 cur.execute("""
-                    INSERT INTO chapters (book_id, title, text, chapter_order)
+                    INSERT INTO chapters (book_id, title, text_hash, chapter_order)
                     VALUES (%s, %s, %s, %s)
-                """, (book_id, chapter.get('title', ''), chapter.get('text', ''), idx))
+                """, (book_id, chapter.get('title', ''), text_hash, idx))
             
             for idx, img_url in enumerate(body_data.get('generatedImages', [])):
                 illustrations = body_data.get('illustrations', {})
@@ -183,6 +323,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             conn.commit()
             cur.close()
             conn.close()
+            invalidate_library_cache(user_id)
             
             return {
                 'statusCode': 200,
@@ -227,4 +368,195 @@ def verify_token(token: str) -> int:
         user_id = int(parts[0])
         return user_id
     except:
-        return None
\ No newline at end of file
+        return None
+
+def chapter_text_codec() -> str:
+    '''
+    Codec for new chapter bodies: CHAPTER_TEXT_CODEC env, 'none' by default since TOAST already
+    compresses the bodies; zstd falls back to zlib if not installed
+    '''
+    codec = os.environ.get('CHAPTER_TEXT_CODEC', 'none').lower()
+    if codec == 'zstd' and zstandard is None:
+        return 'zlib'
+    if codec not in ('zstd', 'zlib', 'none'):
+        return 'none'
+    return codec
+
+def encode_chapter_text(raw: bytes, codec: str) -> Tuple[str, bytes]:
+    '''Compress UTF-8 chapter text, keeping it raw when compression does not help'''
+    if codec == 'zstd':
+        packed = zstandard.ZstdCompressor(level=10).compress(raw)
+    elif codec == 'zlib':
+        packed = zlib.compress(raw, 6)
+    else:
+        return 'none', raw
+    
+    if len(packed) >= len(raw):
+        return 'none', raw
+    return codec, packed
+
+def decode_chapter_text(codec: str, body: bytes) -> str:
+    '''Inverse of encode_chapter_text'''
+    body = bytes(body)
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError('zstandard is required to read zstd chapter texts')
+        body = zstandard.ZstdDecompressor().decompress(body)
+    elif codec == 'zlib':
+        body = zlib.decompress(body)
+    return body.decode('utf-8')
+
+def store_chapter_texts(cur, texts: List[str]) -> List[str]:
+    '''
+    Save chapter bodies into chapter_texts once per content hash, return the hashes in order.
+    Only bodies not stored yet are compressed, so re-saving unchanged chapters costs one lookup.
+    Existing bodies are locked FOR KEY SHARE so the chapter_texts cleanup trigger (V0002) cannot delete
+    them before the new chapters referencing them are inserted.
+    '''
+    raw_texts = [(text or '').encode('utf-8') for text in texts]
+    hashes = [hashlib.sha256(raw).hexdigest() for raw in raw_texts]
+    if not hashes:
+        return hashes
+    
+    cur.execute("""
+        SELECT text_hash FROM chapter_texts WHERE text_hash = ANY(%s)
+        FOR KEY SHARE
+    """, (list(set(hashes)),))
+    stored = {row['text_hash'] for row in cur.fetchall()}
+    
+    codec = chapter_text_codec()
+    for text_hash, raw in zip(hashes, raw_texts):
+        if text_hash in stored:
+            continue
+        stored.add(text_hash)
+        body_codec, body = encode_chapter_text(raw, codec)
+        cur.execute("""
+            INSERT INTO chapter_texts (text_hash, codec, body, raw_size)
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (text_hash) DO NOTHING
+        """, (text_hash, body_codec, psycopg2.Binary(body), len(raw)))
+    return hashes
+
+def chapter_from_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    '''Build chapter dict from a chapters+chapter_texts row, decoding the blob if present'''
+    chapter = dict(row)
+    codec = chapter.pop('codec')
+    body = chapter.pop('body')
+    chapter['text'] = decode_chapter_text(codec, body) if body is not None else None
+    return chapter
+
+def json_default(value: Any) -> Any:
+    '''Stdlib fallback for types orjson encodes natively'''
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+def dumps(data: Any) -> bytes:
+    '''Serialize to UTF-8 JSON with orjson when installed (JSON_SERIALIZER=stdlib forces the fallback)'''
+    if orjson is not None and os.environ.get('JSON_SERIALIZER') != 'stdlib':
+        return orjson.dumps(data, default=str)
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'), default=json_default).encode('utf-8')
+
+def accepts_encoding(accept_encoding: str, coding: str) -> bool:
+    '''True if the Accept-Encoding header allows coding with q > 0, directly or through *'''
+    qualities = {}
+    for part in accept_encoding.lower().split(','):
+        name, *params = [item.strip() for item in part.split(';')]
+        if not name:
+            continue
+        quality = 1.0
+        for param in params:
+            key, _, value = param.partition('=')
+            if key.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[name] = quality
+    return qualities.get(coding, qualities.get('*', 0.0)) > 0
+
+def encoded_response(status: int, body: bytes, response_headers: Dict[str, str],
+                     request_headers: Dict[str, str]) -> Dict[str, Any]:
+    '''Build HTTP response, brotli/gzip-compressing bodies above COMPRESS_MIN_BYTES when the client accepts it'''
+    accept = request_headers.get('accept-encoding') or request_headers.get('Accept-Encoding') or ''
+    response_headers = dict(response_headers, Vary='Accept-Encoding')
+    
+    encoding = None
+    if len(body) >= COMPRESS_MIN_BYTES:
+        if accepts_encoding(accept, 'br') and brotli is not None:
+            body = brotli.compress(body, quality=5)
+            encoding = 'br'
+        elif accepts_encoding(accept, 'gzip'):
+            body = gzip.compress(body, compresslevel=4)
+            encoding = 'gzip'
+    
+    if encoding is None:
+        return {
+            'statusCode': status,
+            'headers': response_headers,
+            'isBase64Encoded': False,
+            'body': body.decode('utf-8')
+        }
+    
+    response_headers['Content-Encoding'] = encoding
+    return {
+        'statusCode': status,
+        'headers': response_headers,
+        'isBase64Encoded': True,
+        'body': base64.b64encode(body).decode('ascii')
+    }
+
+def library_etag(cur, user_id: int) -> str:
+    '''Weak ETag of the user's library, stamped by book count and latest books.updated_at'''
+    cur.execute("""
+        SELECT count(*) AS book_count, max(updated_at) AS updated_at
+        FROM books WHERE user_id = %s
+    """, (user_id,))
+    version = cur.fetchone()
+    stamp = f"{user_id}:{version['book_count']}:{version['updated_at']}"
+    return 'W/"' + hashlib.sha1(stamp.encode('utf-8')).hexdigest() + '"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    '''Weak comparison of an If-None-Match header against the current ETag'''
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    
+    def opaque(tag: str) -> str:
+        tag = tag.strip()
+        return tag[2:] if tag.startswith('W/') else tag
+    
+    return any(opaque(tag) == opaque(etag) for tag in if_none_match.split(','))
+
+def cache_tiers() -> List[LibraryCache]:
+    return [tier for tier in (memory_cache, shared_cache) if tier is not None]
+
+def read_cached_library(user_id: int, etag: str) -> Optional[bytes]:
+    '''Serialized library from the first tier holding the current version, backfilling the memory tier'''
+    key = str(user_id)
+    for tier in cache_tiers():
+        try:
+            entry = tier.get(key)
+        except Exception:
+            continue
+        if entry is not None and entry[0] == etag:
+            if tier is not memory_cache:
+                memory_cache.set(key, etag, entry[1])
+            return entry[1]
+    return None
+
+def write_cached_library(user_id: int, etag: str, body: bytes) -> None:
+    for tier in cache_tiers():
+        try:
+            tier.set(str(user_id), etag, body)
+        except Exception:
+            pass
+
+def invalidate_library_cache(user_id: int) -> None:
+    '''Drop the user's library from every tier after a write to their books'''
+    for tier in cache_tiers():
+        try:
+            tier.delete(str(user_id))
+        except Exception:
+            pass
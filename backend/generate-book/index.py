@@ -1,20 +1,57 @@
 import json
 import os
-from typing import Dict, Any, List, Optional
+import base64
+import gzip
+import time
+import uuid
+from typing import Dict, Any, List, Optional, Tuple
 from gigachat import GigaChat
+import psycopg2
+from psycopg2.extras import RealDictCursor
 
-def generate_with_gigachat(prompt: str, api_key: str) -> str:
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_BYTES = int(os.environ.get('RESPONSE_COMPRESS_MIN_BYTES', '1024'))
+GENERATION_TIME_BUDGET = float(os.environ.get('GENERATION_TIME_BUDGET', '240'))
+GENERATION_JOB_RETENTION_DAYS = int(os.environ.get('GENERATION_JOB_RETENTION_DAYS', '14'))
+OPENAI_API_BASE = os.environ.get('OPENAI_API_BASE', 'https://api.openai.com/v1')
+
+def gigachat_client() -> Optional[GigaChat]:
+    '''
+    GigaChat client for one handler invocation, None without GIGACHAT_API_KEY.
+    Shared by the outline and all chapters so the OAuth token is fetched once.
+    GIGACHAT_BASE_URL / GIGACHAT_AUTH_URL override the endpoints.
+    '''
+    api_key = os.environ.get('GIGACHAT_API_KEY')
+    if not api_key:
+        return None
+    
+    endpoints = {}
+    if os.environ.get('GIGACHAT_BASE_URL'):
+        endpoints['base_url'] = os.environ['GIGACHAT_BASE_URL']
+    if os.environ.get('GIGACHAT_AUTH_URL'):
+        endpoints['auth_url'] = os.environ['GIGACHAT_AUTH_URL']
+    return GigaChat(credentials=api_key, scope='GIGACHAT_API_PERS', verify_ssl_certs=False, **endpoints)
+
+def generate_with_gigachat(prompt: str, giga: GigaChat) -> str:
     '''Generate text using GigaChat API'''
-    with GigaChat(credentials=api_key, scope='GIGACHAT_API_PERS', verify_ssl_certs=False) as giga:
-        response = giga.chat(prompt)
-        return response.choices[0].message.content
+    response = giga.chat(prompt)
+    return response.choices[0].message.content
 
 def generate_with_openai(prompt: str, api_key: str) -> str:
     '''Generate text using OpenAI API as fallback'''
     import requests
     
     response = requests.post(
-        'https://api.openai.com/v1/chat/completions',
+        f'{OPENAI_API_BASE}/chat/completions',
         headers={
             'Authorization': f'Bearer {api_key}',
             'Content-Type': 'application/json'
@@ -59,11 +96,217 @@ def parse_chapters(book_text: str) -> List[Dict[str, str]]:
     
     return chapters
 
+def dumps(data: Any) -> bytes:
+    '''Serialize to UTF-8 JSON with orjson when installed (JSON_SERIALIZER=stdlib forces the fallback)'''
+    if orjson is not None and os.environ.get('JSON_SERIALIZER') != 'stdlib':
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+def accepts_encoding(accept_encoding: str, coding: str) -> bool:
+    '''True if the Accept-Encoding header allows coding with q > 0, directly or through *'''
+    qualities = {}
+    for part in accept_encoding.lower().split(','):
+        name, *params = [item.strip() for item in part.split(';')]
+        if not name:
+            continue
+        quality = 1.0
+        for param in params:
+            key, _, value = param.partition('=')
+            if key.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[name] = quality
+    return qualities.get(coding, qualities.get('*', 0.0)) > 0
+
+def encoded_response(status: int, body: bytes, response_headers: Dict[str, str],
+                     request_headers: Dict[str, str]) -> Dict[str, Any]:
+    '''Build HTTP response, brotli/gzip-compressing bodies above COMPRESS_MIN_BYTES when the client accepts it'''
+    accept = request_headers.get('accept-encoding') or request_headers.get('Accept-Encoding') or ''
+    response_headers = dict(response_headers, Vary='Accept-Encoding')
+    
+    encoding = None
+    if len(body) >= COMPRESS_MIN_BYTES:
+        if accepts_encoding(accept, 'br') and brotli is not None:
+            body = brotli.compress(body, quality=5)
+            encoding = 'br'
+        elif accepts_encoding(accept, 'gzip'):
+            body = gzip.compress(body, compresslevel=4)
+            encoding = 'gzip'
+    
+    if encoding is None:
+        return {
+            'statusCode': status,
+            'headers': response_headers,
+            'isBase64Encoded': False,
+            'body': body.decode('utf-8')
+        }
+    
+    response_headers['Content-Encoding'] = encoding
+    return {
+        'statusCode': status,
+        'headers': response_headers,
+        'isBase64Encoded': True,
+        'body': base64.b64encode(body).decode('ascii')
+    }
+
+def generate_text(prompt: str, giga: Optional[GigaChat]) -> Tuple[str, str]:
+    '''
+    Generate text with GigaChat, falling back to OpenAI; raises with both errors if neither works.
+    Blank content counts as a failure of that provider.
+    '''
+    openai_key = os.environ.get('OPENAI_API_KEY')
+    error_message = None
+    
+    if giga is not None:
+        try:
+            text = generate_with_gigachat(prompt, giga)
+            if not (text or '').strip():
+                raise Exception('empty response')
+            return text, 'GigaChat'
+        except Exception as e:
+            error_message = f'GigaChat failed: {str(e)}'
+    
+    if openai_key:
+        try:
+            text = generate_with_openai(prompt, openai_key)
+            if not (text or '').strip():
+                raise Exception('empty response')
+            return text, 'OpenAI'
+        except Exception as e:
+            if error_message:
+                error_message += f' | OpenAI failed: {str(e)}'
+            else:
+                error_message = f'OpenAI failed: {str(e)}'
+    
+    raise Exception(error_message or 'No API keys configured')
+
+def book_brief(params: Dict[str, Any]) -> str:
+    '''Book parameters block shared by the outline and chapter prompts'''
+    def joined(value: Any) -> str:
+        return ', '.join(value) if isinstance(value, list) else value
+    
+    characters_text = '\n'.join([
+        f"- {char['name']} ({char['role']}): {char.get('personality', '')} | Мотивация: {char.get('motivation', '')}"
+        for char in params.get('characters', [])
+    ])
+    
+    return f"""НАЗВАНИЕ: {params.get('title', '')}
+ЖАНР: {joined(params.get('genre', ''))}
+ОПИСАНИЕ: {params.get('description', '')}
+ГЛАВНАЯ ИДЕЯ: {params.get('idea', '')}
+
+ПЕРСОНАЖИ:
+{characters_text}
+
+ПОВОРОТНЫЙ МОМЕНТ: {params.get('turningPoint', '')}
+УНИКАЛЬНЫЕ ФИШКИ: {params.get('uniqueFeatures', '')}
+
+ОБЪЁМ: {params.get('pages', '100-200')} страниц
+СТИЛЬ: {joined(params.get('writingStyle', 'literary'))}
+ТОН: {joined(params.get('textTone', 'serious'))}"""
+
+def outline_prompt(params: Dict[str, Any]) -> str:
+    return f"""Ты профессиональный писатель. Составь план книги со следующими параметрами:
+
+{book_brief(params)}
+
+План должен содержать:
+- Пролог (если уместно)
+- 10-15 глав с названиями
+- Развитие сюжета и персонажей
+- Кульминацию и развязку
+- Эпилог (если уместно)
+
+Для каждой главы напиши краткое содержание (3-5 предложений).
+
+Формат ответа:
+# НАЗВАНИЕ ГЛАВЫ 1
+[краткое содержание]
+
+# НАЗВАНИЕ ГЛАВЫ 2
+[краткое содержание]
+
+И так далее."""
+
+def chapter_prompt(params: Dict[str, Any], outline: List[Dict[str, str]], order: int,
+                   previous_text: Optional[str], next_text: Optional[str]) -> str:
+    '''Prompt for one chapter: brief, full outline and the neighbouring chapters as context'''
+    outline_text = '\n'.join([
+        f"{idx + 1}. {item['title']}: {item['summary']}" for idx, item in enumerate(outline)
+    ])
+    chapter = outline[order]
+    
+    context = ''
+    if previous_text:
+        context += f"\n\nКОНЕЦ ПРЕДЫДУЩЕЙ ГЛАВЫ:\n{previous_text[-2000:]}"
+    if next_text:
+        context += f"\n\nНАЧАЛО СЛЕДУЮЩЕЙ ГЛАВЫ:\n{next_text[:1000]}"
+    
+    return f"""Ты профессиональный писатель. Пишешь книгу со следующими параметрами:
+
+{book_brief(params)}
+
+ПЛАН КНИГИ:
+{outline_text}{context}
+
+Напиши главу {order + 1} «{chapter['title']}» по плану: {chapter['summary']}
+
+Глава должна быть полноценной (1000-2000 слов), продолжать предыдущую главу и подводить к следующей. Используй литературный язык, создавай атмосферу, раскрывай персонажей через действия и диалоги.
+
+Верни только текст главы, без заголовка."""
+
+def is_chapter_number(value: Any) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool)
+
+def delete_expired_jobs(cur) -> None:
+    '''
+    Retention for checkpoints: jobs idle for GENERATION_JOB_RETENTION_DAYS are deleted together with
+    their generation_chapters (ON DELETE CASCADE); a saved book keeps its own copy of the text
+    '''
+    cur.execute("""
+        DELETE FROM generation_jobs
+        WHERE updated_at < CURRENT_TIMESTAMP - make_interval(days => %s)
+    """, (GENERATION_JOB_RETENTION_DAYS,))
+
+def create_job(cur, params: Dict[str, Any], outline: List[Dict[str, str]]) -> str:
+    job_id = str(uuid.uuid4())
+    cur.execute("""
+        INSERT INTO generation_jobs (id, params, outline)
+        VALUES (%s, %s, %s)
+    """, (job_id, json.dumps(params, ensure_ascii=False), json.dumps(outline, ensure_ascii=False)))
+    return job_id
+
+def load_job(cur, job_id: str) -> Optional[Dict[str, Any]]:
+    cur.execute("SELECT id, params, outline FROM generation_jobs WHERE id = %s", (job_id,))
+    return cur.fetchone()
+
+def load_job_chapters(cur, job_id: str) -> Dict[int, Dict[str, Any]]:
+    cur.execute("""
+        SELECT chapter_order, title, text, generated_by
+        FROM generation_chapters WHERE job_id = %s
+        ORDER BY chapter_order
+    """, (job_id,))
+    return {row['chapter_order']: dict(row) for row in cur.fetchall()}
+
+def save_job_chapter(cur, job_id: str, order: int, title: str, text: str, generated_by: str) -> None:
+    '''Checkpoint one finished chapter, replacing an earlier version of it'''
+    cur.execute("""
+        INSERT INTO generation_chapters (job_id, chapter_order, title, text, generated_by)
+        VALUES (%s, %s, %s, %s, %s)
+        ON CONFLICT (job_id, chapter_order)
+        DO UPDATE SET title = EXCLUDED.title, text = EXCLUDED.text,
+                      generated_by = EXCLUDED.generated_by, created_at = CURRENT_TIMESTAMP
+    """, (job_id, order, title, text, generated_by))
+    cur.execute("UPDATE generation_jobs SET updated_at = CURRENT_TIMESTAMP WHERE id = %s", (job_id,))
+
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
-    Business: Generate full book text using AI with automatic fallback
-    Args: event with httpMethod, body containing book data; context with request_id
-    Returns: HTTP response with generated book chapters
+    Business: Generate book text chapter by chapter using AI with automatic fallback, checkpointing every chapter
+    Args: event with httpMethod, body containing book data, or jobId with optional resumeFrom / regenerateChapters
+          (1-based chapter numbers); context with request_id
+    Returns: HTTP response with generated book chapters, job_id and remaining_chapters when generation stopped early
     '''
     method: str = event.get('httpMethod', 'GET')
     
@@ -90,130 +333,207 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': json.dumps({'error': 'Method not allowed'})
         }
     
+    giga = None
     try:
+        started = time.monotonic()
+        giga = gigachat_client()
         body_data = json.loads(event.get('body', '{}'))
+        job_id = body_data.get('jobId')
         
-        title = body_data.get('title', '')
-        
-        genre_data = body_data.get('genre', '')
-        if isinstance(genre_data, list):
-            genre = ', '.join(genre_data)
-        else:
-            genre = genre_data
-            
-        description = body_data.get('description', '')
-        idea = body_data.get('idea', '')
-        characters = body_data.get('characters', [])
-        turning_point = body_data.get('turningPoint', '')
-        unique_features = body_data.get('uniqueFeatures', '')
-        pages = body_data.get('pages', '100-200')
-        
-        style_data = body_data.get('writingStyle', 'literary')
-        if isinstance(style_data, list):
-            writing_style = ', '.join(style_data)
-        else:
-            writing_style = style_data
-            
-        tone_data = body_data.get('textTone', 'serious')
-        if isinstance(tone_data, list):
-            text_tone = ', '.join(tone_data)
-        else:
-            text_tone = tone_data
-        
-        characters_text = '\n'.join([
-            f"- {char['name']} ({char['role']}): {char.get('personality', '')} | Мотивация: {char.get('motivation', '')}"
-            for char in characters
-        ])
+        regenerate = body_data.get('regenerateChapters')
+        resume_from = body_data.get('resumeFrom')
+        if regenerate is not None and not (
+            isinstance(regenerate, list) and regenerate and all(is_chapter_number(n) for n in regenerate)
+        ):
+            return {
+                'statusCode': 400,
+                'headers': {
+                    'Content-Type': 'application/json',
+                    'Access-Control-Allow-Origin': '*'
+                },
+                'isBase64Encoded': False,
+                'body': json.dumps({'error': 'regenerateChapters должен быть списком номеров глав'})
+            }
+        if resume_from is not None and not (is_chapter_number(resume_from) and resume_from >= 1):
+            return {
+                'statusCode': 400,
+                'headers': {
+                    'Content-Type': 'application/json',
+                    'Access-Control-Allow-Origin': '*'
+                },
+                'isBase64Encoded': False,
+                'body': json.dumps({'error': 'resumeFrom должен быть номером главы'})
+            }
+        if (regenerate is not None or resume_from is not None) and not job_id:
+            return {
+                'statusCode': 400,
+                'headers': {
+                    'Content-Type': 'application/json',
+                    'Access-Control-Allow-Origin': '*'
+                },
+                'isBase64Encoded': False,
+                'body': json.dumps({'error': 'regenerateChapters и resumeFrom требуют jobId'})
+            }
         
-        prompt = f"""Ты профессиональный писатель. Напиши полноценную книгу со следующими параметрами:
-
-НАЗВАНИЕ: {title}
-ЖАНР: {genre}
-ОПИСАНИЕ: {description}
-ГЛАВНАЯ ИДЕЯ: {idea}
-
-ПЕРСОНАЖИ:
-{characters_text}
-
-ПОВОРОТНЫЙ МОМЕНТ: {turning_point}
-УНИКАЛЬНЫЕ ФИШКИ: {unique_features}
-
-ОБЪЁМ: {pages} страниц
-СТИЛЬ: {writing_style}
-ТОН: {text_tone}
-
-Напиши ПОЛНЫЙ ТЕКСТ книги с:
-- Прологом (если уместно)
-- 10-15 главами с названиями
-- Развитием сюжета и персонажей
-- Диалогами и описаниями
-- Кульминацией и развязкой
-- Эпилогом (если уместно)
-
-Каждая глава должна быть полноценной (1000-2000 слов). Используй литературный язык, создавай атмосферу, раскрывай персонажей через действия и диалоги.
-
-Формат ответа:
-# НАЗВАНИЕ ГЛАВЫ 1
-[текст главы]
-
-# НАЗВАНИЕ ГЛАВЫ 2
-[текст главы]
-
-И так далее."""
-
-        gigachat_key = os.environ.get('GIGACHAT_API_KEY')
-        openai_key = os.environ.get('OPENAI_API_KEY')
+        dsn = os.environ.get('DATABASE_URL')
+        if not dsn:
+            return {
+                'statusCode': 500,
+                'headers': {
+                    'Content-Type': 'application/json',
+                    'Access-Control-Allow-Origin': '*'
+                },
+                'isBase64Encoded': False,
+                'body': json.dumps({'error': 'Database not configured'})
+            }
         
-        book_text = None
-        used_service = None
-        error_message = None
+        conn = psycopg2.connect(dsn)
+        conn.autocommit = True
+        cur = conn.cursor(cursor_factory=RealDictCursor)
         
-        if gigachat_key:
-            try:
-                book_text = generate_with_gigachat(prompt, gigachat_key)
-                used_service = 'GigaChat'
-            except Exception as e:
-                error_message = f'GigaChat failed: {str(e)}'
-                
-        if not book_text and openai_key:
+        if job_id:
+            job = load_job(cur, job_id)
+            if not job:
+                cur.close()
+                conn.close()
+                return {
+                    'statusCode': 404,
+                    'headers': {
+                        'Content-Type': 'application/json',
+                        'Access-Control-Allow-Origin': '*'
+                    },
+                    'isBase64Encoded': False,
+                    'body': json.dumps({'error': 'Генерация не найдена'})
+                }
+            params = job['params']
+            outline = job['outline']
+        else:
+            params = body_data
             try:
-                book_text = generate_with_openai(prompt, openai_key)
-                used_service = 'OpenAI'
+                outline_text, _ = generate_text(outline_prompt(params), giga)
             except Exception as e:
-                if error_message:
-                    error_message += f' | OpenAI failed: {str(e)}'
-                else:
-                    error_message = f'OpenAI failed: {str(e)}'
+                cur.close()
+                conn.close()
+                return {
+                    'statusCode': 500,
+                    'headers': {
+                        'Content-Type': 'application/json',
+                        'Access-Control-Allow-Origin': '*'
+                    },
+                    'isBase64Encoded': False,
+                    'body': json.dumps({
+                        'error': 'Не удалось сгенерировать книгу. Оба сервиса недоступны.',
+                        'details': str(e)
+                    })
+                }
+            outline = [
+                {'title': item['title'], 'summary': item['text']}
+                for item in parse_chapters(outline_text)
+            ]
+            if not outline:
+                cur.close()
+                conn.close()
+                return {
+                    'statusCode': 500,
+                    'headers': {
+                        'Content-Type': 'application/json',
+                        'Access-Control-Allow-Origin': '*'
+                    },
+                    'isBase64Encoded': False,
+                    'body': json.dumps({
+                        'error': 'Не удалось составить план книги.',
+                        'details': 'Outline has no chapter headings'
+                    })
+                }
+            delete_expired_jobs(cur)
+            job_id = create_job(cur, params, outline)
+        
+        stored = load_job_chapters(cur, job_id)
+        total = len(outline)
         
-        if not book_text:
+        if regenerate:
+            numbers = sorted(set(regenerate))
+        elif resume_from is not None:
+            numbers = list(range(resume_from, total + 1))
+        else:
+            numbers = [n for n in range(1, total + 1) if n - 1 not in stored]
+        
+        if any(n < 1 or n > total for n in numbers) or (resume_from is not None and resume_from > total):
+            cur.close()
+            conn.close()
             return {
-                'statusCode': 500,
+                'statusCode': 400,
                 'headers': {
                     'Content-Type': 'application/json',
                     'Access-Control-Allow-Origin': '*'
                 },
                 'isBase64Encoded': False,
-                'body': json.dumps({
-                    'error': 'Не удалось сгенерировать книгу. Оба сервиса недоступны.',
-                    'details': error_message
-                })
+                'body': json.dumps({'error': f'Номер главы должен быть от 1 до {total}'})
             }
         
-        chapters = parse_chapters(book_text)
+        used_service = None
+        slowest_chapter = 0.0
+        remaining: List[int] = []
+        for position, number in enumerate(numbers):
+            if position > 0 and time.monotonic() - started + slowest_chapter > GENERATION_TIME_BUDGET:
+                remaining = numbers[position:]
+                break
+            
+            order = number - 1
+            previous_chapter = stored.get(order - 1)
+            next_chapter = stored.get(order + 1)
+            prompt = chapter_prompt(
+                params, outline, order,
+                previous_chapter['text'] if previous_chapter else None,
+                next_chapter['text'] if next_chapter else None
+            )
+            
+            chapter_started = time.monotonic()
+            try:
+                text, used_service = generate_text(prompt, giga)
+            except Exception as e:
+                cur.close()
+                conn.close()
+                return {
+                    'statusCode': 500,
+                    'headers': {
+                        'Content-Type': 'application/json',
+                        'Access-Control-Allow-Origin': '*'
+                    },
+                    'isBase64Encoded': False,
+                    'body': json.dumps({
+                        'error': f'Не удалось сгенерировать главу {number}. Оба сервиса недоступны.',
+                        'details': str(e),
+                        'job_id': job_id,
+                        'resume_from': number,
+                        'remaining_chapters': numbers[position:],
+                        'completed_chapters': sorted(o + 1 for o in stored)
+                    })
+                }
+            slowest_chapter = max(slowest_chapter, time.monotonic() - chapter_started)
+            
+            chapter = {'title': outline[order]['title'], 'text': text.strip(), 'generated_by': used_service}
+            save_job_chapter(cur, job_id, order, chapter['title'], chapter['text'], used_service)
+            stored[order] = chapter
         
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'isBase64Encoded': False,
-            'body': json.dumps({
-                'chapters': chapters,
-                'total_chapters': len(chapters),
-                'generated_by': used_service
-            }, ensure_ascii=False)
-        }
+        cur.close()
+        conn.close()
+        
+        still_to_do = sorted(set(remaining) | {o + 1 for o in range(total) if o not in stored})
+        chapters = [{'title': stored[o]['title'], 'text': stored[o]['text']} for o in sorted(stored)]
+        
+        return encoded_response(200, dumps({
+            'chapters': chapters,
+            'total_chapters': len(chapters),
+            'generated_by': used_service or next((c['generated_by'] for c in stored.values()), None),
+            'job_id': job_id,
+            'complete': not still_to_do,
+            'resume_from': still_to_do[0] if still_to_do else None,
+            'remaining_chapters': still_to_do
+        }), {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*'
+        }, event.get('headers') or {})
         
     except Exception as e:
         return {
@@ -225,3 +545,6 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False,
             'body': json.dumps({'error': str(e)})
         }
+    finally:
+        if giga is not None:
+            giga.close()
@@ -2,6 +2,9 @@ import json
 import os
 from typing import Dict, Any
 
+POEHALI_API_BASE = os.environ.get('POEHALI_API_BASE', 'https://poehali.dev')
+OPENAI_API_BASE = os.environ.get('OPENAI_API_BASE', 'https://api.openai.com/v1')
+
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Business: Generate images with automatic fallback between services
@@ -59,7 +62,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             try:
                 import requests
                 response = requests.post(
-                    'https://poehali.dev/.api/generate-image',
+                    f'{POEHALI_API_BASE}/.api/generate-image',
                     headers={'Content-Type': 'application/json'},
                     json={'prompt': prompt},
                     timeout=60
@@ -78,7 +81,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             try:
                 import requests
                 response = requests.post(
-                    'https://api.openai.com/v1/images/generations',
+                    f'{OPENAI_API_BASE}/images/generations',
                     headers={
                         'Authorization': f'Bearer {openai_key}',
                         'Content-Type': 'application/json'
@@ -0,0 +1,54 @@
+-- Create chapter_texts table: chapter bodies deduplicated by SHA-256 of the UTF-8 text.
+-- codec is 'none', 'zlib' or 'zstd'; body holds the (possibly compressed) bytes.
+CREATE TABLE chapter_texts (
+    text_hash CHAR(64) PRIMARY KEY,
+    codec VARCHAR(10) NOT NULL DEFAULT 'none',
+    body BYTEA NOT NULL,
+    raw_size INTEGER NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Reference chapter bodies from chapters
+ALTER TABLE chapters ADD COLUMN text_hash CHAR(64);
+
+-- Move existing chapter bodies into chapter_texts (stored uncompressed, new saves use CHAPTER_TEXT_CODEC)
+INSERT INTO chapter_texts (text_hash, codec, body, raw_size)
+SELECT DISTINCT
+    encode(sha256(convert_to(text, 'UTF8')), 'hex'),
+    'none',
+    convert_to(text, 'UTF8'),
+    octet_length(text)
+FROM chapters
+WHERE text IS NOT NULL
+ON CONFLICT (text_hash) DO NOTHING;
+
+UPDATE chapters
+SET text_hash = encode(sha256(convert_to(text, 'UTF8')), 'hex')
+WHERE text IS NOT NULL;
+
+-- Bodies live in chapter_texts only
+ALTER TABLE chapters DROP COLUMN text;
+
+CREATE INDEX idx_chapters_text_hash ON chapters(text_hash);
+
+-- Bodies are shared between chapters, so delete a body once no chapter references it anymore:
+-- after chapters are deleted (including cascades from books and users) or re-pointed to another body.
+-- Transition tables allow one event per trigger, hence two triggers.
+CREATE OR REPLACE FUNCTION delete_unreferenced_chapter_texts() RETURNS TRIGGER AS $$
+BEGIN
+    DELETE FROM chapter_texts t
+    WHERE t.text_hash IN (SELECT DISTINCT text_hash FROM old_chapters WHERE text_hash IS NOT NULL)
+      AND NOT EXISTS (SELECT 1 FROM chapters c WHERE c.text_hash = t.text_hash);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_chapters_delete_collect_texts
+    AFTER DELETE ON chapters
+    REFERENCING OLD TABLE AS old_chapters
+    FOR EACH STATEMENT EXECUTE FUNCTION delete_unreferenced_chapter_texts();
+
+CREATE TRIGGER trg_chapters_update_collect_texts
+    AFTER UPDATE ON chapters
+    REFERENCING OLD TABLE AS old_chapters
+    FOR EACH STATEMENT EXECUTE FUNCTION delete_unreferenced_chapter_texts();
@@ -0,0 +1,32 @@
+-- Create generation_jobs table: one row per book generation, holds the request parameters and outline
+CREATE TABLE generation_jobs (
+    id VARCHAR(36) PRIMARY KEY,
+    params JSONB NOT NULL,
+    outline JSONB NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Create generation_chapters table: checkpoint of every finished chapter
+CREATE TABLE generation_chapters (
+    id SERIAL PRIMARY KEY,
+    job_id VARCHAR(36) NOT NULL,
+    chapter_order INTEGER NOT NULL,
+    title VARCHAR(500) NOT NULL,
+    text TEXT,
+    generated_by VARCHAR(50),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (job_id, chapter_order)
+);
+
+-- Retention: before creating a job, generate-book deletes jobs idle for GENERATION_JOB_RETENTION_DAYS
+-- (14 by default) together with their generation_chapters
+CREATE INDEX idx_generation_jobs_updated_at ON generation_jobs(updated_at);
+
+-- Books keep the job that generated them, so single chapters can be regenerated later
+-- (until the job expires, then the link is cleared)
+ALTER TABLE books ADD COLUMN generation_job_id VARCHAR(36);
+ALTER TABLE books
+    ADD CONSTRAINT fk_books_generation_job FOREIGN KEY (generation_job_id)
+    REFERENCES generation_jobs(id) ON DELETE SET NULL;
+CREATE INDEX idx_books_generation_job_id ON books(generation_job_id);
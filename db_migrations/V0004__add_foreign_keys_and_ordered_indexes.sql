@@ -0,0 +1,118 @@
+-- Remove orphaned rows so the foreign keys can be created
+DELETE FROM books WHERE user_id NOT IN (SELECT id FROM users);
+DELETE FROM characters WHERE book_id NOT IN (SELECT id FROM books);
+DELETE FROM chapters WHERE book_id NOT IN (SELECT id FROM books);
+DELETE FROM illustrations WHERE book_id NOT IN (SELECT id FROM books);
+DELETE FROM generation_chapters WHERE job_id NOT IN (SELECT id FROM generation_jobs);
+
+-- Foreign keys: deleting a user or book removes everything that belongs to it
+ALTER TABLE books
+    ADD CONSTRAINT fk_books_user FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE;
+ALTER TABLE characters
+    ADD CONSTRAINT fk_characters_book FOREIGN KEY (book_id) REFERENCES books(id) ON DELETE CASCADE;
+ALTER TABLE chapters
+    ADD CONSTRAINT fk_chapters_book FOREIGN KEY (book_id) REFERENCES books(id) ON DELETE CASCADE;
+ALTER TABLE illustrations
+    ADD CONSTRAINT fk_illustrations_book FOREIGN KEY (book_id) REFERENCES books(id) ON DELETE CASCADE;
+ALTER TABLE generation_chapters
+    ADD CONSTRAINT fk_generation_chapters_job FOREIGN KEY (job_id) REFERENCES generation_jobs(id) ON DELETE CASCADE;
+
+-- Chapter bodies are shared between chapters, so they are never cascaded
+ALTER TABLE chapters
+    ADD CONSTRAINT fk_chapters_text FOREIGN KEY (text_hash) REFERENCES chapter_texts(text_hash);
+
+-- Library ETag stamp (count, max(updated_at)) as an index-only scan; the listing filters on the
+-- same leading column and sorts its few dozen rows in memory, so a created_at index would not be used
+DROP INDEX idx_books_user_id;
+CREATE INDEX idx_books_user_updated ON books(user_id, updated_at);
+
+-- Ordered child lookups; the chapters index covers the books GET query for index-only scans
+DROP INDEX idx_chapters_book_id;
+DROP INDEX idx_illustrations_book_id;
+CREATE INDEX idx_chapters_book_order ON chapters(book_id, chapter_order)
+    INCLUDE (id, title, text_hash, created_at);
+CREATE INDEX idx_illustrations_book_order ON illustrations(book_id, illustration_order);
+
+-- Keep updated_at current on every update. clock_timestamp() rather than the transaction start, and always
+-- past the previous value, so the library ETag (count, max(updated_at)) changes even when a transaction
+-- that started earlier commits after another writer bumped the same row.
+CREATE OR REPLACE FUNCTION set_updated_at() RETURNS TRIGGER AS $$
+BEGIN
+    NEW.updated_at = greatest(clock_timestamp()::timestamp, OLD.updated_at + interval '1 microsecond');
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_books_updated_at
+    BEFORE UPDATE ON books
+    FOR EACH ROW EXECUTE FUNCTION set_updated_at();
+
+CREATE TRIGGER trg_generation_jobs_updated_at
+    BEFORE UPDATE ON generation_jobs
+    FOR EACH ROW EXECUTE FUNCTION set_updated_at();
+
+-- Changes to a book's characters, chapters or illustrations bump books.updated_at (the library cache version),
+-- one UPDATE per statement. Books this transaction already wrote (inserted by the same POST, or touched by an
+-- earlier statement) are skipped: their new updated_at becomes visible together with the child rows.
+-- Transition tables allow one event per trigger, hence three triggers per table.
+CREATE OR REPLACE FUNCTION touch_parent_books() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE books SET updated_at = clock_timestamp()
+        WHERE id IN (SELECT book_id FROM new_rows) AND xmin <> pg_current_xact_id()::xid;
+    ELSIF TG_OP = 'UPDATE' THEN
+        UPDATE books SET updated_at = clock_timestamp()
+        WHERE id IN (SELECT book_id FROM new_rows UNION SELECT book_id FROM old_rows)
+          AND xmin <> pg_current_xact_id()::xid;
+    ELSE
+        UPDATE books SET updated_at = clock_timestamp()
+        WHERE id IN (SELECT book_id FROM old_rows) AND xmin <> pg_current_xact_id()::xid;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_characters_insert_touch_book
+    AFTER INSERT ON characters
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION touch_parent_books();
+
+CREATE TRIGGER trg_characters_update_touch_book
+    AFTER UPDATE ON characters
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION touch_parent_books();
+
+CREATE TRIGGER trg_characters_delete_touch_book
+    AFTER DELETE ON characters
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION touch_parent_books();
+
+CREATE TRIGGER trg_chapters_insert_touch_book
+    AFTER INSERT ON chapters
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION touch_parent_books();
+
+CREATE TRIGGER trg_chapters_update_touch_book
+    AFTER UPDATE ON chapters
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION touch_parent_books();
+
+CREATE TRIGGER trg_chapters_delete_touch_book
+    AFTER DELETE ON chapters
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION touch_parent_books();
+
+CREATE TRIGGER trg_illustrations_insert_touch_book
+    AFTER INSERT ON illustrations
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION touch_parent_books();
+
+CREATE TRIGGER trg_illustrations_update_touch_book
+    AFTER UPDATE ON illustrations
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION touch_parent_books();
+
+CREATE TRIGGER trg_illustrations_delete_touch_book
+    AFTER DELETE ON illustrations
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION touch_parent_books();
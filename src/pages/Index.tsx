@@ -45,6 +45,7 @@ type BookData = {
   illustrations: IllustrationSettings;
   generatedImages: string[];
   chapters?: Chapter[];
+  jobId?: string | null;
 };
 
 const Index = () => {
@@ -134,7 +135,8 @@ const Index = () => {
         chapters: book.chapters.map((ch: any) => ({
           title: ch.title,
           text: ch.text
-        }))
+        })),
+        jobId: book.generation_job_id
       }));
       setBooks(mappedBooks);
     } catch (error: any) {
@@ -413,39 +415,56 @@ const Index = () => {
         toast.info('📚 Генерация текста книги...');
         
         try {
-          const response = await fetch('https://functions.poehali.dev/2f50210e-c8d5-4275-968b-16b64e5f5d39', {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({
-              title: currentBook.title,
-              genre: currentBook.genre,
-              description: currentBook.description,
-              idea: currentBook.idea,
-              characters: currentBook.characters,
-              turningPoint: currentBook.turningPoint,
-              uniqueFeatures: currentBook.uniqueFeatures,
-              pages: currentBook.pages,
-              writingStyle: currentBook.writingStyle,
-              textTone: currentBook.textTone
-            })
-          });
-
-          if (!response.ok) {
-            const errorText = await response.text();
-            console.error('Ошибка генерации текста:', errorText);
-            let errorData;
-            try {
-              errorData = JSON.parse(errorText);
-            } catch {
-              errorData = { error: `HTTP ${response.status}: ${errorText}` };
+          let requestBody: any = {
+            title: currentBook.title,
+            genre: currentBook.genre,
+            description: currentBook.description,
+            idea: currentBook.idea,
+            characters: currentBook.characters,
+            turningPoint: currentBook.turningPoint,
+            uniqueFeatures: currentBook.uniqueFeatures,
+            pages: currentBook.pages,
+            writingStyle: currentBook.writingStyle,
+            textTone: currentBook.textTone
+          };
+          let retriesLeft = 2;
+
+          while (true) {
+            const response = await fetch('https://functions.poehali.dev/2f50210e-c8d5-4275-968b-16b64e5f5d39', {
+              method: 'POST',
+              headers: { 'Content-Type': 'application/json' },
+              body: JSON.stringify(requestBody)
+            });
+
+            if (!response.ok) {
+              const errorText = await response.text();
+              console.error('Ошибка генерации текста:', errorText);
+              let errorData;
+              try {
+                errorData = JSON.parse(errorText);
+              } catch {
+                errorData = { error: `HTTP ${response.status}: ${errorText}` };
+              }
+              if (errorData.job_id && errorData.remaining_chapters?.length && retriesLeft > 0) {
+                retriesLeft--;
+                setGenerationProgress(prev => ({ ...prev, text: `⏳ Повтор с главы ${errorData.resume_from}...` }));
+                requestBody = { jobId: errorData.job_id, regenerateChapters: errorData.remaining_chapters };
+                continue;
+              }
+              throw new Error(errorData.error || errorData.details || 'Ошибка генерации текста книги');
+            }
+
+            const data = await response.json();
+            if (!data.complete && data.remaining_chapters?.length) {
+              setGenerationProgress(prev => ({ ...prev, text: `⏳ ${data.total_chapters} глав готово, продолжаем...` }));
+              requestBody = { jobId: data.job_id, regenerateChapters: data.remaining_chapters };
+              continue;
             }
-            throw new Error(errorData.error || errorData.details || 'Ошибка генерации текста книги');
-          }
 
-          const data = await response.json();
-          setGenerationProgress(prev => ({ ...prev, text: `✅ ${data.total_chapters} глав готово!` }));
-          toast.success(`✅ Текст книги сгенерирован! ${data.total_chapters} глав`);
-          return data.chapters;
+            setGenerationProgress(prev => ({ ...prev, text: `✅ ${data.total_chapters} глав готово!` }));
+            toast.success(`✅ Текст книги сгенерирован! ${data.total_chapters} глав`);
+            return { chapters: data.chapters, jobId: data.job_id };
+          }
         } catch (error: any) {
           console.error('Ошибка при генерации текста:', error);
           setGenerationProgress(prev => ({ ...prev, text: '❌ Ошибка текста' }));
@@ -453,7 +472,7 @@ const Index = () => {
         }
       };
 
-      const [images, chapters] = await Promise.all([generateImagesTask(), generateTextTask()]);
+      const [images, { chapters, jobId }] = await Promise.all([generateImagesTask(), generateTextTask()]);
 
       toast.info('💾 Сохранение книги в базу данных...');
 
@@ -475,7 +494,8 @@ const Index = () => {
           mood: currentBook.illustrations.mood,
           order: index + 1
         })),
-        chapters: chapters
+        chapters: chapters,
+        jobId: jobId
       };
 
       if (editingBook) {
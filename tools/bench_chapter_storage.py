@@ -0,0 +1,146 @@
+'''
+Benchmark chapter storage: the V0001 layout (chapters.text) vs the current migrations
+(deduplicated, compressed chapter_texts). Both schemas are built from db_migrations/ in scratch schemas,
+filled with the same synthetic library; reports table sizes and per-book read latency.
+
+Usage: DATABASE_URL=postgres://... python tools/bench_chapter_storage.py [--books 10000] [--chapters 12]
+       [--chapter-chars 6000] [--resave-ratio 0.5] [--codec none] [--reads 500] [--keep]
+'''
+import argparse
+import os
+import random
+import statistics
+import time
+from typing import List, Dict, Any
+
+import psycopg2
+from psycopg2.extras import RealDictCursor, execute_values
+
+from bench_support import apply_migrations, load_function, make_text
+
+LEGACY_SCHEMA = 'bench_storage_legacy'
+DEDUP_SCHEMA = 'bench_storage_dedup'
+
+def make_library(args) -> List[List[Dict[str, Any]]]:
+    '''Books as lists of chapters; a share of books are re-saves of earlier ones'''
+    rng = random.Random(42)
+    library = []
+    for _ in range(args.books):
+        if library and rng.random() < args.resave_ratio:
+            library.append(library[rng.randrange(len(library))])
+            continue
+        library.append([
+            {'title': f'Глава {i + 1}', 'text': make_text(rng, args.chapter_chars)}
+            for i in range(args.chapters)
+        ])
+    return library
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+def insert_book(cur, schema: str, user_id: int) -> int:
+    cur.execute(f'INSERT INTO {schema}.books (user_id, title) VALUES (%s, %s) RETURNING id', (user_id, 'Книга'))
+    return cur.fetchone()['id']
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--books', type=int, default=10000)
+    parser.add_argument('--chapters', type=int, default=12)
+    parser.add_argument('--chapter-chars', type=int, default=6000)
+    parser.add_argument('--resave-ratio', type=float, default=0.5)
+    parser.add_argument('--codec', default='none', choices=['none', 'zlib', 'zstd'])
+    parser.add_argument('--reads', type=int, default=500)
+    parser.add_argument('--keep', action='store_true', help='keep the scratch schemas')
+    args = parser.parse_args()
+    
+    os.environ['CHAPTER_TEXT_CODEC'] = args.codec
+    books = load_function('books')
+    library = make_library(args)
+    
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    conn.autocommit = True
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    apply_migrations(cur, LEGACY_SCHEMA, upto='V0001')
+    apply_migrations(cur, DEDUP_SCHEMA)
+    
+    user_ids = {}
+    for schema in (LEGACY_SCHEMA, DEDUP_SCHEMA):
+        cur.execute(f"""
+            INSERT INTO {schema}.users (email, password_hash) VALUES ('bench@storage.local', 'x') RETURNING id
+        """)
+        user_ids[schema] = cur.fetchone()['id']
+    
+    conn.autocommit = False
+    started = time.perf_counter()
+    book_ids = []
+    for book_number, chapters in enumerate(library, start=1):
+        legacy_id = insert_book(cur, LEGACY_SCHEMA, user_ids[LEGACY_SCHEMA])
+        execute_values(cur, f'INSERT INTO {LEGACY_SCHEMA}.chapters (book_id, title, text, chapter_order) VALUES %s', [
+            (legacy_id, ch['title'], ch['text'], idx) for idx, ch in enumerate(chapters)
+        ])
+        
+        cur.execute(f'SET search_path TO {DEDUP_SCHEMA}')
+        dedup_id = insert_book(cur, DEDUP_SCHEMA, user_ids[DEDUP_SCHEMA])
+        hashes = books.store_chapter_texts(cur, [ch['text'] for ch in chapters])
+        execute_values(cur, 'INSERT INTO chapters (book_id, title, text_hash, chapter_order) VALUES %s', [
+            (dedup_id, ch['title'], text_hash, idx) for idx, (ch, text_hash) in enumerate(zip(chapters, hashes))
+        ])
+        book_ids.append((legacy_id, dedup_id))
+        if book_number % 500 == 0:
+            conn.commit()
+    conn.commit()
+    print(f'filled {len(library)} books x {args.chapters} chapters in {time.perf_counter() - started:.1f}s')
+    
+    conn.autocommit = True
+    for table in (f'{LEGACY_SCHEMA}.chapters', f'{DEDUP_SCHEMA}.chapters', f'{DEDUP_SCHEMA}.chapter_texts'):
+        cur.execute(f'VACUUM ANALYZE {table}')
+    
+    cur.execute(f"""
+        SELECT pg_total_relation_size('{LEGACY_SCHEMA}.chapters') AS legacy,
+               pg_total_relation_size('{DEDUP_SCHEMA}.chapters') AS chapters,
+               pg_total_relation_size('{DEDUP_SCHEMA}.chapter_texts') AS blobs,
+               (SELECT count(*) FROM {DEDUP_SCHEMA}.chapter_texts) AS blob_count,
+               (SELECT count(*) FROM {DEDUP_SCHEMA}.chapters) AS chapter_count
+    """)
+    sizes = cur.fetchone()
+    new_total = sizes['chapters'] + sizes['blobs']
+    print(f"V0001 chapters (text inline):   {sizes['legacy'] / 2**20:9.1f} MiB")
+    print(f"chapters + chapter_texts:       {new_total / 2**20:9.1f} MiB "
+          f"({sizes['chapters'] / 2**20:.1f} + {sizes['blobs'] / 2**20:.1f}; "
+          f"{sizes['blob_count']} blobs for {sizes['chapter_count']} chapters, codec={args.codec})")
+    print(f'ratio:                          {new_total / sizes["legacy"]:9.2f}')
+    
+    rng = random.Random(7)
+    sample = [rng.choice(book_ids) for _ in range(args.reads)]
+    legacy_ms, new_ms = [], []
+    for legacy_id, dedup_id in sample:
+        t0 = time.perf_counter()
+        cur.execute(f'SELECT * FROM {LEGACY_SCHEMA}.chapters WHERE book_id = %s ORDER BY chapter_order', (legacy_id,))
+        [dict(c) for c in cur.fetchall()]
+        legacy_ms.append((time.perf_counter() - t0) * 1000)
+        
+        t0 = time.perf_counter()
+        cur.execute(f"""
+            SELECT c.id, c.book_id, c.title, c.chapter_order, c.created_at, t.codec, t.body
+            FROM {DEDUP_SCHEMA}.chapters c
+            LEFT JOIN {DEDUP_SCHEMA}.chapter_texts t ON t.text_hash = c.text_hash
+            WHERE c.book_id = %s
+            ORDER BY c.chapter_order
+        """, (dedup_id,))
+        [books.chapter_from_row(c) for c in cur.fetchall()]
+        new_ms.append((time.perf_counter() - t0) * 1000)
+    
+    for name, values in (('V0001', legacy_ms), ('deduplicated', new_ms)):
+        print(f'{name:>12} read per book: p50 {statistics.median(values):6.2f} ms, '
+              f'p95 {percentile(values, 0.95):6.2f} ms')
+    
+    if not args.keep:
+        cur.execute('SET search_path TO public')
+        cur.execute(f'DROP SCHEMA {LEGACY_SCHEMA} CASCADE')
+        cur.execute(f'DROP SCHEMA {DEDUP_SCHEMA} CASCADE')
+    cur.close()
+    conn.close()
+
+if __name__ == '__main__':
+    main()
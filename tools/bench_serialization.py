@@ -0,0 +1,96 @@
+'''
+Benchmark books GET serialization on a synthetic library: response bytes and encode time
+for the old stdlib call, the stdlib fallback and orjson, with and without gzip/brotli.
+
+Usage: python tools/bench_serialization.py [--books 20] [--chapters 12] [--chapter-chars 6000] [--repeat 20]
+'''
+import argparse
+import gzip
+import json
+import os
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List
+
+from bench_support import load_function, make_text
+
+def make_library(args) -> Dict[str, Any]:
+    '''Same shape as books GET: books with characters, chapters and illustrations'''
+    rng = random.Random(42)
+    created = datetime(2025, 1, 1, 12, 0, 0)
+    books = []
+    for book_id in range(1, args.books + 1):
+        stamp = created + timedelta(hours=book_id)
+        books.append({
+            'id': book_id, 'title': f'Книга {book_id}', 'genre': 'фэнтези, детектив',
+            'description': make_text(rng, 400), 'idea': make_text(rng, 200),
+            'turning_point': make_text(rng, 200), 'unique_features': make_text(rng, 200),
+            'pages': '100-200', 'writing_style': 'литературный', 'text_tone': 'серьёзный',
+            'created_at': stamp,
+            'characters': [{
+                'id': book_id * 10 + i, 'book_id': book_id, 'name': f'Герой {i}', 'age': '30',
+                'appearance': make_text(rng, 150), 'personality': make_text(rng, 150),
+                'background': make_text(rng, 150), 'motivation': make_text(rng, 100),
+                'role': 'main', 'created_at': stamp
+            } for i in range(4)],
+            'chapters': [{
+                'id': book_id * 100 + i, 'book_id': book_id, 'title': f'Глава {i + 1}',
+                'text': make_text(rng, args.chapter_chars), 'chapter_order': i, 'created_at': stamp
+            } for i in range(args.chapters)],
+            'illustrations': [{
+                'id': book_id * 10 + i, 'book_id': book_id, 'image_url': f'https://cdn.poehali.dev/img/{book_id}-{i}.png',
+                'style': 'realistic', 'color_scheme': 'warm', 'mood': 'calm', 'illustration_order': i,
+                'created_at': stamp
+            } for i in range(3)]
+        })
+    return {'books': books}
+
+def timed(fn: Callable[[], bytes], repeat: int) -> List[float]:
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return samples
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--books', type=int, default=20)
+    parser.add_argument('--chapters', type=int, default=12)
+    parser.add_argument('--chapter-chars', type=int, default=6000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    
+    books = load_function('books')
+    payload = make_library(args)
+    
+    def stdlib_fallback() -> bytes:
+        os.environ['JSON_SERIALIZER'] = 'stdlib'
+        try:
+            return books.dumps(payload)
+        finally:
+            os.environ.pop('JSON_SERIALIZER')
+    
+    serializers = {'json.dumps(default=str)': lambda: json.dumps(payload, default=str).encode('utf-8'),
+                   'dumps (stdlib fallback)': stdlib_fallback}
+    if books.orjson is not None:
+        serializers['dumps (orjson)'] = lambda: books.dumps(payload)
+    
+    for name, fn in serializers.items():
+        body = fn()
+        samples = sorted(timed(fn, args.repeat))
+        print(f'{name:<26} {len(body) / 1024:9.1f} KiB  encode p50 {samples[len(samples) // 2]:7.2f} ms')
+    
+    body = books.dumps(payload)
+    for name, compress in (('gzip-4', lambda: gzip.compress(body, compresslevel=4)),
+                           ('brotli-5', (lambda: books.brotli.compress(body, quality=5)) if books.brotli else None)):
+        if compress is None:
+            print(f'{name:<26} skipped, module not installed')
+            continue
+        packed = compress()
+        samples = sorted(timed(compress, args.repeat))
+        print(f'{name:<26} {len(packed) / 1024:9.1f} KiB  compress p50 {samples[len(samples) // 2]:7.2f} ms')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+'''
+Shared helpers for the scripts in tools/: loading a backend function module, synthetic Cyrillic text
+and applying db_migrations/ into a scratch schema.
+'''
+import importlib.util
+import random
+from pathlib import Path
+from typing import Optional
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+BACKEND_DIR = ROOT_DIR / 'backend'
+MIGRATIONS_DIR = ROOT_DIR / 'db_migrations'
+
+WORDS = (
+    'лес дорога тень город окно ветер старик девушка письмо дверь ночь огонь '
+    'море берег память сердце тайна голос шаги свет песок замок книга река '
+    'сказал ответила подумал вдруг медленно тихо снова никогда впрочем потом '
+    'холодный тёмный далёкий странный последний живой пустой верный'
+).split()
+
+def load_function(name: str):
+    '''Import backend/<name>/index.py as a module'''
+    spec = importlib.util.spec_from_file_location(name.replace('-', '_'), BACKEND_DIR / name / 'index.py')
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def make_text(rng: random.Random, chars: int) -> str:
+    '''Random sentences from WORDS, at least chars long'''
+    parts = []
+    size = 0
+    while size < chars:
+        sentence = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(6, 16))).capitalize() + '.'
+        parts.append(sentence)
+        size += len(sentence) + 1
+    return ' '.join(parts)
+
+def apply_migrations(cur, schema: str, upto: Optional[str] = None) -> None:
+    '''
+    Recreate schema and run db_migrations/V*.sql inside it, optionally stopping after the migration
+    whose name starts with upto (e.g. 'V0001'). Leaves search_path pointing at the schema.
+    '''
+    cur.execute(f'DROP SCHEMA IF EXISTS {schema} CASCADE')
+    cur.execute(f'CREATE SCHEMA {schema}')
+    cur.execute(f'SET search_path TO {schema}')
+    for migration in sorted(MIGRATIONS_DIR.glob('V*.sql')):
+        cur.execute(migration.read_text(encoding='utf-8'))
+        if upto and migration.name.startswith(upto):
+            break
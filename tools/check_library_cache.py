@@ -0,0 +1,119 @@
+'''
+End-to-end check of the books GET library cache against a local Postgres: 304 on a matching
+If-None-Match, cache hits from the shared tier, and invalidation on POST.
+Runs the books handler on a scratch schema built from db_migrations/ with DictLibraryCache,
+an in-process stand-in for the shared tier, plugged in. Exits 1 if any check fails.
+
+Usage: DATABASE_URL=postgres://localhost/postgres python tools/check_library_cache.py [--keep]
+'''
+import argparse
+import json
+import os
+import sys
+from typing import Any, Dict, List, Optional, Tuple
+
+import psycopg2
+
+from bench_support import apply_migrations, load_function
+
+SCHEMA = 'library_cache_check'
+
+def make_stand_in(books):
+    class DictLibraryCache(books.LibraryCache):
+        '''Shared-tier stand-in: a dict plus a log of calls'''
+        def __init__(self):
+            self.entries: Dict[str, Tuple[str, bytes]] = {}
+            self.calls: List[Tuple[str, str]] = []
+        
+        def get(self, key: str) -> Optional[Tuple[str, bytes]]:
+            self.calls.append(('get', key))
+            return self.entries.get(key)
+        
+        def set(self, key: str, etag: str, body: bytes) -> None:
+            self.calls.append(('set', key))
+            self.entries[key] = (etag, body)
+        
+        def delete(self, key: str) -> None:
+            self.calls.append(('delete', key))
+            self.entries.pop(key, None)
+    
+    return DictLibraryCache()
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--keep', action='store_true', help='keep the scratch schema')
+    args = parser.parse_args()
+    
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    conn.autocommit = True
+    cur = conn.cursor()
+    apply_migrations(cur, SCHEMA)
+    cur.execute("INSERT INTO users (email, password_hash) VALUES ('cache@check.local', 'x') RETURNING id")
+    user_id = cur.fetchone()[0]
+    
+    os.environ['PGOPTIONS'] = f'-c search_path={SCHEMA}'
+    books = load_function('books')
+    shared = make_stand_in(books)
+    books.set_shared_cache(shared)
+    key = str(user_id)
+    token = f'{user_id}:check:token'
+    
+    def call(method: str, headers: Optional[Dict[str, str]] = None, body: Any = None) -> Dict[str, Any]:
+        return books.handler({
+            'httpMethod': method,
+            'headers': dict({'X-Auth-Token': token}, **(headers or {})),
+            'body': json.dumps(body) if body is not None else None
+        }, None)
+    
+    def save_book(title: str) -> Dict[str, Any]:
+        return call('POST', body={'title': title, 'chapters': [{'title': 'Глава 1', 'text': 'Текст'}]})
+    
+    failures = []
+    
+    def check(name: str, ok: bool) -> None:
+        print(f"{'ok  ' if ok else 'FAIL'} {name}")
+        if not ok:
+            failures.append(name)
+    
+    try:
+        check('POST saves a book', save_book('Первая')['statusCode'] == 200)
+        
+        first = call('GET')
+        etag = first['headers'].get('ETag')
+        check('GET returns 200 with an ETag', first['statusCode'] == 200 and bool(etag))
+        check('GET fills both tiers', books.memory_cache.get(key) is not None and key in shared.entries)
+        
+        not_modified = call('GET', {'If-None-Match': etag})
+        check('If-None-Match with the current ETag returns 304 and no body',
+              not_modified['statusCode'] == 304 and not_modified['body'] == '')
+        
+        books.memory_cache.delete(key)
+        shared.calls.clear()
+        from_shared = call('GET')
+        check('GET after a memory-tier miss is served from the shared tier',
+              from_shared['body'] == first['body'] and ('get', key) in shared.calls
+              and ('set', key) not in shared.calls)
+        check('shared-tier hit backfills the memory tier', books.memory_cache.get(key) is not None)
+        
+        shared.calls.clear()
+        check('second POST saves a book', save_book('Вторая')['statusCode'] == 200)
+        check('POST invalidates both tiers',
+              ('delete', key) in shared.calls and key not in shared.entries
+              and books.memory_cache.get(key) is None)
+        
+        after_post = call('GET', {'If-None-Match': etag})
+        titles = [b['title'] for b in json.loads(after_post['body'])['books']]
+        check('stale ETag after POST returns 200 with the new library and a new ETag',
+              after_post['statusCode'] == 200 and after_post['headers']['ETag'] != etag
+              and sorted(titles) == ['Вторая', 'Первая'])
+    finally:
+        if not args.keep:
+            cur.execute('SET search_path TO public')
+            cur.execute(f'DROP SCHEMA {SCHEMA} CASCADE')
+        cur.close()
+        conn.close()
+    
+    sys.exit(1 if failures else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+'''
+Query-plan regression check for the hot queries of books GET and generate-book.
+Applies db_migrations/V*.sql into a scratch schema of a local Postgres, seeds it, runs VACUUM ANALYZE
+and checks EXPLAIN output for index-only / ordered index scans. Exits 1 if any expectation fails.
+
+Usage: DATABASE_URL=postgres://localhost/postgres python tools/check_query_plans.py [--users 500] [--keep]
+'''
+import argparse
+import json
+import os
+import sys
+from typing import Any, Dict, Iterator, List
+
+import psycopg2
+
+from bench_support import apply_migrations
+
+SCHEMA = 'query_plan_check'
+TABLES = ['users', 'books', 'chapter_texts', 'chapters', 'characters', 'illustrations',
+          'generation_jobs', 'generation_chapters']
+
+# Seeded with user triggers disabled, so touch_parent_books does not rewrite books.updated_at per child row
+SEED = """
+ALTER TABLE books DISABLE TRIGGER USER;
+ALTER TABLE characters DISABLE TRIGGER USER;
+ALTER TABLE chapters DISABLE TRIGGER USER;
+ALTER TABLE illustrations DISABLE TRIGGER USER;
+
+INSERT INTO users (email, password_hash, name)
+SELECT 'user' || g || '@plans.local', 'x', 'User ' || g FROM generate_series(1, %(users)s) g;
+
+INSERT INTO books (user_id, title, genre, created_at, updated_at)
+SELECT u.id, 'Книга ' || b, 'фэнтези',
+       now() - (b || ' hours')::interval, now() - (b || ' minutes')::interval
+FROM users u, generate_series(1, 20) b
+ORDER BY b, u.id;
+
+INSERT INTO chapter_texts (text_hash, codec, body, raw_size)
+SELECT md5(g::text) || md5((g + 1)::text), 'none', convert_to('Текст главы ' || g, 'UTF8'), 24
+FROM generate_series(1, 50000) g;
+
+INSERT INTO chapters (book_id, title, text_hash, chapter_order)
+SELECT b.id, 'Глава ' || (c + 1),
+       md5(((b.id * 12 + c) %% 50000 + 1)::text) || md5(((b.id * 12 + c) %% 50000 + 2)::text), c
+FROM books b, generate_series(0, 11) c
+ORDER BY b.id, c;
+
+INSERT INTO characters (book_id, name, role)
+SELECT b.id, 'Герой ' || c, 'main' FROM books b, generate_series(1, 4) c
+ORDER BY b.id, c;
+
+INSERT INTO illustrations (book_id, image_url, style, illustration_order)
+SELECT b.id, 'https://cdn.poehali.dev/' || b.id || '-' || i || '.png', 'realistic', i
+FROM books b, generate_series(0, 2) i
+ORDER BY b.id, i;
+
+INSERT INTO generation_jobs (id, params, outline, updated_at)
+SELECT md5(g::text), '{}', '[]', now() - (g %% 14 || ' days')::interval FROM generate_series(1, 2000) g;
+
+INSERT INTO generation_chapters (job_id, chapter_order, title, text)
+SELECT j.id, c, 'Глава ' || (c + 1), 'текст' FROM generation_jobs j, generate_series(0, 11) c
+ORDER BY j.id, c;
+
+ALTER TABLE books ENABLE TRIGGER USER;
+ALTER TABLE characters ENABLE TRIGGER USER;
+ALTER TABLE chapters ENABLE TRIGGER USER;
+ALTER TABLE illustrations ENABLE TRIGGER USER;
+"""
+
+CHECKS = [
+    {
+        'name': 'books GET: library ETag stamp',
+        'sql': 'SELECT count(*), max(updated_at) FROM books WHERE user_id = %(user_id)s',
+        'index_only': 'idx_books_user_updated'
+    },
+    {
+        'name': 'books GET: list books',
+        'sql': """SELECT id, title, genre, description, idea, turning_point,
+                         unique_features, pages, writing_style, text_tone, generation_job_id, created_at
+                  FROM books WHERE user_id = %(user_id)s ORDER BY created_at DESC""",
+        'index': 'idx_books_user_updated'
+    },
+    {
+        'name': 'books GET: chapters of a book',
+        'sql': """SELECT c.id, c.book_id, c.title, c.chapter_order, c.created_at, t.codec, t.body
+                  FROM chapters c
+                  LEFT JOIN chapter_texts t ON t.text_hash = c.text_hash
+                  WHERE c.book_id = %(book_id)s
+                  ORDER BY c.chapter_order""",
+        'index_only': 'idx_chapters_book_order',
+        'no_sort': True
+    },
+    {
+        'name': 'books GET: illustrations of a book',
+        'sql': 'SELECT * FROM illustrations WHERE book_id = %(book_id)s ORDER BY illustration_order',
+        'index': 'idx_illustrations_book_order',
+        'no_sort': True
+    },
+    {
+        'name': 'books GET: characters of a book',
+        'sql': 'SELECT * FROM characters WHERE book_id = %(book_id)s',
+        'index': 'idx_characters_book_id'
+    },
+    {
+        'name': 'generate-book: checkpointed chapters of a job',
+        'sql': """SELECT chapter_order, title, text, generated_by
+                  FROM generation_chapters WHERE job_id = %(job_id)s
+                  ORDER BY chapter_order""",
+        'index': 'generation_chapters_job_id_chapter_order_key',
+        'no_sort': True
+    },
+    {
+        'name': 'generate-book: expired jobs',
+        'sql': """DELETE FROM generation_jobs
+                  WHERE updated_at < CURRENT_TIMESTAMP - make_interval(days => 14)""",
+        'index': 'idx_generation_jobs_updated_at'
+    }
+]
+
+def plan_nodes(node: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    yield node
+    for child in node.get('Plans', []):
+        yield from plan_nodes(child)
+
+def check_plan(nodes: List[Dict[str, Any]], check: Dict[str, Any]) -> List[str]:
+    '''Return a list of failed expectations for one plan'''
+    failures = []
+    if any(n['Node Type'] == 'Seq Scan' for n in nodes):
+        failures.append('has a Seq Scan')
+    if check.get('no_sort') and any(n['Node Type'] in ('Sort', 'Incremental Sort') for n in nodes):
+        failures.append('sorts instead of reading the index in order')
+    if 'index_only' in check and not any(
+        n['Node Type'] == 'Index Only Scan' and n.get('Index Name') == check['index_only'] for n in nodes
+    ):
+        failures.append(f"no Index Only Scan on {check['index_only']}")
+    if 'index' in check and not any(n.get('Index Name') == check['index'] for n in nodes):
+        failures.append(f"does not use {check['index']}")
+    return failures
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--keep', action='store_true', help='keep the scratch schema')
+    args = parser.parse_args()
+    
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    conn.autocommit = True
+    cur = conn.cursor()
+    
+    failed = False
+    try:
+        apply_migrations(cur, SCHEMA)
+        cur.execute(SEED, {'users': args.users})
+        for table in TABLES:
+            cur.execute(f'VACUUM ANALYZE {table}')
+        
+        cur.execute('SELECT user_id, id FROM books ORDER BY id LIMIT 1 OFFSET %s', (args.users * 10,))
+        user_id, book_id = cur.fetchone()
+        cur.execute('SELECT id FROM generation_jobs ORDER BY id LIMIT 1')
+        job_id = cur.fetchone()[0]
+        params = {'user_id': user_id, 'book_id': book_id, 'job_id': job_id}
+        
+        for check in CHECKS:
+            cur.execute('EXPLAIN (FORMAT JSON) ' + check['sql'], params)
+            plan = cur.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            nodes = list(plan_nodes(plan[0]['Plan']))
+            failures = check_plan(nodes, check)
+            summary = ' -> '.join(
+                n['Node Type'] + (f" ({n['Index Name']})" if n.get('Index Name') else '') for n in nodes
+            )
+            print(f"{'FAIL' if failures else 'ok  '} {check['name']}: {summary}")
+            for failure in failures:
+                print(f'     {failure}')
+            failed = failed or bool(failures)
+    finally:
+        if not args.keep:
+            cur.execute('SET search_path TO public')
+            cur.execute(f'DROP SCHEMA {SCHEMA} CASCADE')
+        cur.close()
+        conn.close()
+    
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
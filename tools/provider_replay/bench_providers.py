@@ -0,0 +1,93 @@
+'''
+Drive generate-image / generate-book provider calls against the replay server and report latency,
+status and which provider answered (fallback share). Needs the function's requirements installed.
+Latencies only mean something on recorded fixtures; the shipped ones replay placeholders and say so.
+
+Usage: python tools/provider_replay/bench_providers.py --target generate-image [--calls 50] [--concurrency 10]
+       [--latency-scale 0.01] [--error-rate poehali=0.3] [--timeout-rate gigachat=0.1] [--seed 1]
+'''
+import base64
+import json
+import os
+import statistics
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import server
+from bench_support import load_function
+
+def point_env_at(base: str) -> None:
+    '''Route every provider to the replay server; must run before the function module is imported'''
+    os.environ['GIGACHAT_AUTH_URL'] = f'{base}/gigachat-auth/api/v2/oauth'
+    os.environ['GIGACHAT_BASE_URL'] = f'{base}/gigachat/api/v1'
+    os.environ['OPENAI_API_BASE'] = f'{base}/openai/v1'
+    os.environ['POEHALI_API_BASE'] = f'{base}/poehali'
+    os.environ.setdefault('GIGACHAT_API_KEY', base64.b64encode(b'replay:replay').decode('ascii'))
+    for key in ('OPENAI_API_KEY', 'POEHALI_API_KEY'):
+        os.environ.setdefault(key, 'replay')
+
+def image_call(module) -> Callable[[int], Tuple[str, str]]:
+    def call(i: int) -> Tuple[str, str]:
+        response = module.handler({'httpMethod': 'POST', 'body': json.dumps({'prompt': f'Маяк ночью {i}'})}, None)
+        body = json.loads(response['body'])
+        return str(response['statusCode']), body.get('generated_by') or 'none'
+    return call
+
+def book_text_call(module) -> Callable[[int], Tuple[str, str]]:
+    prompt = module.outline_prompt({'title': 'Маяк', 'genre': 'мистика', 'characters': []})
+    def call(i: int) -> Tuple[str, str]:
+        giga = module.gigachat_client()
+        try:
+            _, service = module.generate_text(prompt, giga)
+            return 'ok', service
+        except Exception:
+            return 'failed', 'none'
+        finally:
+            if giga is not None:
+                giga.close()
+    return call
+
+def main() -> None:
+    parser = server.build_parser()
+    parser.add_argument('--target', choices=['generate-image', 'generate-book'], default='generate-image')
+    parser.add_argument('--calls', type=int, default=50)
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.set_defaults(port=0, latency_scale=0.01)
+    args = parser.parse_args()
+    
+    replay = server.start_server(args)
+    point_env_at(f'http://{args.host}:{replay.server_address[1]}')
+    module = load_function(args.target)
+    call = image_call(module) if args.target == 'generate-image' else book_text_call(module)
+    
+    def timed(i: int) -> Tuple[float, str, str]:
+        t0 = time.perf_counter()
+        status, service = call(i)
+        return (time.perf_counter() - t0) * 1000, status, service
+    
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(timed, range(args.calls)))
+    wall = time.perf_counter() - started
+    replay.shutdown()
+    
+    latencies = sorted(r[0] for r in results)
+    print(f'{args.calls} calls, concurrency {args.concurrency}, wall {wall:.2f}s')
+    print(f'latency p50 {statistics.median(latencies):.0f} ms, p95 {latencies[int(len(latencies) * 0.95) - 1]:.0f} ms, '
+          f'max {latencies[-1]:.0f} ms (latency scale {args.latency_scale})')
+    print('status:', dict(Counter(r[1] for r in results)))
+    print('served by:', dict(Counter(r[2] for r in results)))
+    synthetic = server.synthetic_latency_routes(Path(args.fixtures))
+    if synthetic:
+        print('WARNING: latencies above are NOT valid benchmark results, these fixtures replay placeholder '
+              'latencies (re-record with --record):')
+        for route in synthetic:
+            print(f'  {route}')
+
+if __name__ == '__main__':
+    main()
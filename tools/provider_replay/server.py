@@ -0,0 +1,287 @@
+'''
+Record/replay fake for the AI providers used by generate-book and generate-image.
+
+Every provider is mounted under its own prefix, so handlers can be pointed at the server through env:
+    GIGACHAT_AUTH_URL=http://127.0.0.1:8765/gigachat-auth/api/v2/oauth
+    GIGACHAT_BASE_URL=http://127.0.0.1:8765/gigachat/api/v1
+    OPENAI_API_BASE=http://127.0.0.1:8765/openai/v1
+    POEHALI_API_BASE=http://127.0.0.1:8765/poehali
+
+Replay (default): answers from fixtures/*.json, sleeping for a latency sampled from the recorded ones.
+A fixture response is chosen by exact request hash, then by its optional "match" substring, then round-robin.
+Record: --record proxies to the real providers and appends responses and latencies to the fixtures.
+The shipped fixtures are synthetic: their latency_ms are made-up placeholders (marked "synthetic_latency"),
+so timings measured against them are NOT valid benchmark results. Re-record first; recording into a
+synthetic fixture replaces its placeholder latencies.
+Faults: --error-rate / --timeout-rate take RATE or PREFIX=RATE (e.g. --error-rate gigachat=1 to force fallback).
+Choices, latencies and faults come from an RNG seeded per request, so a run is reproducible under concurrency.
+Record mode redacts access_token and similar credential fields before writing fixtures.
+GET /__stats returns per-route request, error and timeout counters.
+
+Usage: python tools/provider_replay/server.py [--port 8765] [--seed 1] [--latency-scale 0.01]
+       [--error-rate 0.1] [--timeout-rate gigachat=0.2] [--timeout-seconds 65] [--record]
+'''
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+FIXTURES_DIR = Path(__file__).resolve().parent / 'fixtures'
+
+UPSTREAMS = {
+    'gigachat-auth': 'https://ngw.devices.sberbank.ru:9443',
+    'gigachat': 'https://gigachat.devices.sberbank.ru',
+    'openai': 'https://api.openai.com',
+    'poehali': 'https://poehali.dev'
+}
+
+class Fault:
+    '''Per-prefix rate parsed from RATE or PREFIX=RATE options'''
+    def __init__(self, specs: List[str]):
+        self.default = 0.0
+        self.by_prefix: Dict[str, float] = {}
+        for spec in specs:
+            if '=' in spec:
+                prefix, rate = spec.split('=', 1)
+                self.by_prefix[prefix] = float(rate)
+            else:
+                self.default = float(spec)
+    
+    def rate(self, prefix: str) -> float:
+        return self.by_prefix.get(prefix, self.default)
+
+SECRET_FIELDS = {'access_token', 'refresh_token', 'id_token', 'api_key', 'token', 'client_secret'}
+
+def redact(value: Any) -> Any:
+    '''Copy of a response body with credential fields replaced, safe to commit as a fixture'''
+    if isinstance(value, dict):
+        return {k: 'redacted' if k.lower() in SECRET_FIELDS else redact(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [redact(item) for item in value]
+    return value
+
+class ReplayState:
+    '''Fixtures, counters and per-request RNG seeding shared by the request threads'''
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.fixtures_dir = Path(args.fixtures)
+        self.errors = Fault(args.error_rate)
+        self.timeouts = Fault(args.timeout_rate)
+        self.lock = threading.Lock()
+        self.occurrences: Dict[Tuple[str, str], int] = {}
+        self.stats: Dict[str, Dict[str, int]] = {}
+    
+    def fixture_path(self, method: str, path: str) -> Path:
+        slug = re.sub(r'[^a-zA-Z0-9]+', '_', f'{method}_{path}').strip('_').lower()
+        return self.fixtures_dir / f'{slug}.json'
+    
+    def load_fixture(self, method: str, path: str) -> Optional[Dict[str, Any]]:
+        fixture_file = self.fixture_path(method, path)
+        if not fixture_file.exists():
+            return None
+        return json.loads(fixture_file.read_text(encoding='utf-8'))
+    
+    def count(self, route: str, field: str) -> None:
+        with self.lock:
+            counters = self.stats.setdefault(route, {'requests': 0, 'errors': 0, 'timeouts': 0, 'misses': 0})
+            counters[field] += 1
+    
+    def request_rng(self, route: str, request_hash: str) -> random.Random:
+        '''
+        RNG for one request, seeded from --seed, the route, the request body hash and how many identical
+        requests came before it. Outcomes do not depend on how concurrent requests interleave.
+        '''
+        with self.lock:
+            occurrence = self.occurrences.get((route, request_hash), 0)
+            self.occurrences[(route, request_hash)] = occurrence + 1
+        return random.Random(f'{self.args.seed}:{route}:{request_hash}:{occurrence}')
+    
+    def pick(self, fixture: Dict[str, Any], request_hash: str, request_text: str,
+             rng: random.Random) -> Tuple[Dict[str, Any], float]:
+        '''
+        Response recorded for the same request body, else the first whose "match" substring occurs
+        in the request, else a random one; plus a latency sample in seconds
+        '''
+        responses = fixture['responses']
+        response = next((r for r in responses if r.get('request_hash') == request_hash), None)
+        if response is None:
+            response = next((r for r in responses if r.get('match') and r['match'] in request_text), None)
+        if response is None:
+            response = rng.choice(responses)
+        samples = fixture.get('latency_ms') or [0]
+        latency = rng.choice(samples) * rng.uniform(0.9, 1.1)
+        return response, latency * self.args.latency_scale / 1000
+    
+    def record(self, method: str, path: str, request_hash: str, status: int,
+               body: Any, latency_ms: float) -> None:
+        with self.lock:
+            fixture = self.load_fixture(method, path) or {
+                'method': method, 'path': path, 'latency_ms': [], 'responses': []
+            }
+            if fixture.pop('synthetic_latency', False):
+                fixture.pop('note', None)
+                fixture['latency_ms'] = []
+            fixture['latency_ms'].append(round(latency_ms))
+            fixture['responses'] = [r for r in fixture['responses'] if r.get('request_hash') != request_hash]
+            fixture['responses'].append({'request_hash': request_hash, 'status': status, 'body': redact(body)})
+            self.fixtures_dir.mkdir(parents=True, exist_ok=True)
+            self.fixture_path(method, path).write_text(
+                json.dumps(fixture, ensure_ascii=False, indent=2), encoding='utf-8'
+            )
+
+def synthetic_latency_routes(fixtures_dir: Path) -> List[str]:
+    '''Routes whose fixture still carries placeholder latencies instead of recorded ones'''
+    routes = []
+    for fixture_file in sorted(fixtures_dir.glob('*.json')):
+        fixture = json.loads(fixture_file.read_text(encoding='utf-8'))
+        if fixture.get('synthetic_latency'):
+            routes.append(f"{fixture['method']} {fixture['path']}")
+    return routes
+
+def decode_request(body: bytes) -> str:
+    '''Request body as text with JSON \\u escapes resolved, for "match" lookups'''
+    text = body.decode('utf-8', errors='replace')
+    try:
+        return json.dumps(json.loads(text), ensure_ascii=False)
+    except ValueError:
+        return text
+
+def make_handler(state: ReplayState):
+    class ProviderHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        
+        def log_message(self, format: str, *args: Any) -> None:
+            if state.args.verbose:
+                super().log_message(format, *args)
+        
+        def do_GET(self) -> None:
+            if self.path == '/__stats':
+                with state.lock:
+                    self.send_json(200, state.stats)
+                return
+            self.serve()
+        
+        def do_POST(self) -> None:
+            self.serve()
+        
+        def send_json(self, status: int, body: Any) -> None:
+            payload = json.dumps(body, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        
+        def serve(self) -> None:
+            length = int(self.headers.get('Content-Length') or 0)
+            request_body = self.rfile.read(length) if length else b''
+            request_hash = hashlib.sha256(request_body).hexdigest()
+            path = self.path.split('?', 1)[0]
+            prefix = path.strip('/').split('/', 1)[0]
+            route = f'{self.command} {path}'
+            state.count(route, 'requests')
+            
+            if prefix not in UPSTREAMS:
+                self.send_json(404, {'error': f'Unknown provider prefix: {prefix}'})
+                return
+            
+            if state.args.record:
+                self.proxy(prefix, path, request_body, request_hash)
+                return
+            
+            fixture = state.load_fixture(self.command, path)
+            if fixture is None:
+                state.count(route, 'misses')
+                self.send_json(404, {'error': f'No fixture for {route}'})
+                return
+            
+            rng = state.request_rng(route, request_hash)
+            response, latency = state.pick(fixture, request_hash, decode_request(request_body), rng)
+            times_out = rng.random() < state.timeouts.rate(prefix)
+            fails = rng.random() < state.errors.rate(prefix)
+            
+            if times_out:
+                state.count(route, 'timeouts')
+                time.sleep(state.args.timeout_seconds * state.args.latency_scale)
+                self.close_connection = True
+                return
+            
+            time.sleep(latency)
+            if fails:
+                state.count(route, 'errors')
+                self.send_json(503, {'error': 'Injected provider error'})
+                return
+            
+            self.send_json(response['status'], response['body'])
+        
+        def proxy(self, prefix: str, path: str, request_body: bytes, request_hash: str) -> None:
+            upstream = UPSTREAMS[prefix] + path[len(prefix) + 1:]
+            skipped = ('host', 'content-length', 'accept-encoding')
+            headers = {k: v for k, v in self.headers.items() if k.lower() not in skipped}
+            request = urllib.request.Request(upstream, data=request_body or None, headers=headers, method=self.command)
+            started = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request, timeout=state.args.timeout_seconds) as upstream_response:
+                    status, raw = upstream_response.status, upstream_response.read()
+            except urllib.error.HTTPError as e:
+                status, raw = e.code, e.read()
+            latency_ms = (time.perf_counter() - started) * 1000
+            
+            try:
+                body = json.loads(raw)
+            except ValueError:
+                body = raw.decode('utf-8', errors='replace')
+            state.record(self.command, path, request_hash, status, body, latency_ms)
+            self.send_json(status, body)
+    
+    return ProviderHandler
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='Record/replay fake for AI provider APIs')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--fixtures', default=str(FIXTURES_DIR))
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--latency-scale', type=float, default=1.0, help='multiplier for recorded latencies')
+    parser.add_argument('--error-rate', action='append', default=[], metavar='[PREFIX=]RATE')
+    parser.add_argument('--timeout-rate', action='append', default=[], metavar='[PREFIX=]RATE')
+    parser.add_argument('--timeout-seconds', type=float, default=65.0,
+                        help='how long an injected timeout hangs before dropping the connection '
+                             '(scaled by --latency-scale), and the upstream timeout in record mode')
+    parser.add_argument('--record', action='store_true', help='proxy to real providers and save fixtures')
+    parser.add_argument('--verbose', action='store_true')
+    return parser
+
+def start_server(args: argparse.Namespace) -> ThreadingHTTPServer:
+    '''Start the server on a daemon thread, for use from benchmarks'''
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(ReplayState(args)))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main() -> None:
+    args = build_parser().parse_args()
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(ReplayState(args)))
+    server.daemon_threads = True
+    mode = 'recording' if args.record else 'replaying'
+    print(f'{mode} providers on http://{args.host}:{server.server_address[1]}')
+    if not args.record:
+        for route in synthetic_latency_routes(Path(args.fixtures)):
+            print(f'warning: {route} replays placeholder latencies, not valid for benchmarking')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    main()